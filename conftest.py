@@ -0,0 +1,26 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+
+# Run before xdist's own hook, which turns xdist_group marks into node id suffixes
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):
+    """Group tests for ``pytest -n <workers> --dist=loadgroup``.
+
+    Tests marked ``serial`` all go to one worker so they never contend for GPUs.
+    All other tests are grouped by file so that module and class scoped fixtures
+    are only built once.
+    """
+    if not config.pluginmanager.hasplugin("xdist"):
+        return
+    for item in items:
+        if item.get_closest_marker("serial"):
+            group = "serial"
+        else:
+            group = item.nodeid.split("::")[0]
+        item.add_marker(pytest.mark.xdist_group(name=group))
@@ -94,7 +94,7 @@ def video_vqvae_mugen(
     if pretrained_model_key:
         model.load_state_dict(
             torch.hub.load_state_dict_from_url(
-                MUGEN_PRETRAINED_MAPPING[pretrained_model_key]
+                MUGEN_PRETRAINED_MAPPING[pretrained_model_key], map_location="cpu"
             )
         )
 
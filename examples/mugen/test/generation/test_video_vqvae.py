@@ -4,18 +4,51 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
+from typing import Dict
+
 import pytest
 import torch
 
 from examples.mugen.generation.video_vqvae import video_vqvae_mugen
 from test.test_utils import assert_expected, set_rng_seed
 
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# bf16 autocast of the decoder only pays off on GPUs with bf16 tensor cores. CPU
+# runs stay in fp32 so the checkpoint sums keep their tight tolerance.
+USE_BF16 = DEVICE.type == "cuda" and torch.cuda.is_bf16_supported()
+# Opt-in smoke test of fp8 inference. Needs torchao and an fp8-capable GPU, and
+# checks the expected sums with a looser tolerance.
+USE_FP8 = os.environ.get("MUGEN_VQVAE_FP8") == "1"
+
+
+def decode(model, x):
+    """Runs the VQVAE forward with only the decoder under bf16 autocast.
+
+    The encoder and codebook stay in fp32 so bf16 rounding cannot flip
+    near-tied codebook assignments.
+    """
+    with torch.inference_mode():
+        quantized = model.codebook(model.encoder(x)).quantized
+        with torch.autocast(DEVICE.type, dtype=torch.bfloat16, enabled=USE_BF16):
+            return model.decoder(quantized)
+
 
 @pytest.fixture(autouse=True)
 def random():
     set_rng_seed(4)
 
 
+@pytest.fixture(scope="module", autouse=True)
+def cudnn_benchmark():
+    # Input shapes are fixed per test, so let cuDNN pick the fastest conv3d
+    # algorithm on the first call for each shape and reuse it afterwards
+    old_benchmark = torch.backends.cudnn.benchmark
+    torch.backends.cudnn.benchmark = True
+    yield
+    torch.backends.cudnn.benchmark = old_benchmark
+
+
 @pytest.fixture(scope="module")
 def params():
     in_channel_dims = (2, 2)
@@ -36,24 +69,39 @@ class TestVideoVQVAEMUGEN:
         def create_model(model_key):
             model = video_vqvae_mugen(pretrained_model_key=model_key)
             model.eval()
+            model.requires_grad_(False)
+            model.to(DEVICE)
+            if USE_FP8:
+                if DEVICE.type != "cuda":
+                    pytest.skip("fp8 quantization requires a CUDA device")
+                quantization = pytest.importorskip("torchao.quantization")
+                quantization.quantize_(
+                    model, quantization.Float8DynamicActivationFloat8WeightConfig()
+                )
             return model
 
         return create_model
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def input_data(self):
+        cache: Dict[int, torch.Tensor] = {}
+
         def create_data(seq_len):
-            return torch.randn(1, 3, seq_len, 256, 256)
+            if seq_len not in cache:
+                # A fresh CPU generator per shape reproduces the samples the
+                # expected values were recorded with, independent of test order
+                generator = torch.Generator().manual_seed(4)
+                x = torch.randn(1, 3, seq_len, 256, 256, generator=generator)
+                cache[seq_len] = x.to(DEVICE)
+            return cache[seq_len]
 
         return create_data
 
     def test_forward(self, vv, input_data):
         x = input_data(32)
         model = vv(None)
-        output = model(x)
-        actual = torch.tensor(output.decoded.shape)
-        expected = torch.tensor((1, 3, 32, 256, 256))
-        assert_expected(actual, expected)
+        decoded = decode(model, x)
+        assert tuple(decoded.shape) == (1, 3, 32, 256, 256)
 
     @pytest.mark.parametrize(
         "seq_len,expected", [(8, 132017.28125), (16, -109636.0), (32, 1193122.0)]
@@ -64,7 +112,13 @@ class TestVideoVQVAEMUGEN:
         model = vv(model_key)
         # ensure embed init flag is turned off
         assert model.codebook._is_embedding_init
-        output = model(x)
-        actual_tensor = torch.sum(output.decoded)
+        decoded = decode(model, x)
+        actual_tensor = torch.sum(decoded.float()).cpu()
         expected_tensor = torch.tensor(expected)
-        assert_expected(actual_tensor, expected_tensor, rtol=1e-5, atol=1e-8)
+        if USE_FP8:
+            rtol, atol = 5e-2, 1e3
+        elif USE_BF16:
+            rtol, atol = 1e-2, 1e-1
+        else:
+            rtol, atol = 1e-5, 1e-8
+        assert_expected(actual_tensor, expected_tensor, rtol=rtol, atol=atol)
@@ -5,9 +5,11 @@
 # LICENSE file in the root directory of this source tree.
 
 import unittest
+from typing import Any, List, Optional, Tuple
 
+import pytest
 import torch
-from test.test_utils import assert_expected
+from test.test_utils import assert_expected, set_rng_seed
 from torch import nn
 from torchmultimodal.models.flava.model import (
     flava_image_encoder,
@@ -19,120 +21,148 @@ from torchmultimodal.models.flava.model import (
 from torchmultimodal.modules.layers.transformer import TransformerOutput
 
 NUM_CLASSES = 2
+PRETRAINING_OUTPUTS = (
+    "mlm_output",
+    "mim_output",
+    "global_contrastive_output",
+    "mmm_text_output",
+    "mmm_image_output",
+    "itm_output",
+)
 
 
-class TestFLAVA(unittest.TestCase):
-    def setUp(self):
-        torch.manual_seed(1234)
+def _total_loss(output: Any) -> float:
+    losses = [value for value in output.losses.values() if value is not None]
+    return torch.stack(losses).sum().item()
+
+
+class _CachedEncoder(nn.Module):
+    """Wraps an encoder and reuses its last output when it is called again with
+    the very same input objects. Only valid for an encoder in eval mode.
+    """
+
+    def __init__(self, encoder: nn.Module) -> None:
+        super().__init__()
+        self.encoder = encoder
+        self._inputs: Optional[List[Tuple[Any, Any]]] = None
+        self._output: Any = None
 
-    @torch.no_grad()
-    def test_forward_classification(self):
+    def forward(self, *args: Any, **kwargs: Any) -> Any:
+        inputs = list(enumerate(args)) + sorted(kwargs.items())
+        if (
+            self._inputs is None
+            or len(inputs) != len(self._inputs)
+            or any(
+                name != cached_name or value is not cached_value
+                for (name, value), (cached_name, cached_value) in zip(
+                    inputs, self._inputs
+                )
+            )
+        ):
+            self._inputs = inputs
+            self._output = self.encoder(*args, **kwargs)
+        return self._output
+
+
+class TestFLAVA:
+    @pytest.fixture(scope="class")
+    def classification_inputs(self):
+        set_rng_seed(1234)
         text = torch.randint(0, 30500, (2, 77), dtype=torch.long)
         image = torch.rand((2, 3, 224, 224))
-
         labels = torch.randint(0, 2, (2,), dtype=torch.long)
+        return image, text, labels
 
+    @pytest.fixture(scope="class")
+    def flava_cls(self, classification_inputs):
+        # Depends on classification_inputs so the model is initialized right after
+        # the inputs, from the same RNG stream
         flava = flava_model_for_classification(NUM_CLASSES, pretrained_model_key=None)
         flava.eval()
+        # All three modes encode the same image and text, so run each unimodal
+        # encoder once and let the heads reuse its output
+        flava.model.image_encoder = _CachedEncoder(flava.model.image_encoder)
+        flava.model.text_encoder = _CachedEncoder(flava.model.text_encoder)
+        return flava
 
-        # Test multimodal scenario
-        output = flava(image, text, "mm", labels)
-        self.assertAlmostEqual(output.loss.item(), 0.7180, places=4)
-
-        # Test unimodal image scenario
-        output = flava(image, text, "image", labels)
-        self.assertAlmostEqual(output.loss.item(), 0.7020, places=4)
-
-        # Test unimodal text scenario
-        output = flava(image, text, "text", labels)
-        self.assertAlmostEqual(output.loss.item(), 0.6663, places=4)
-
-    @torch.no_grad()
-    def test_forward_pretraining(self):
+    @pytest.fixture(scope="class")
+    def pretraining_inputs(self):
+        set_rng_seed(1234)
         text = torch.randint(0, 30500, (2, 77), dtype=torch.long)
         image = torch.rand((2, 3, 224, 224))
         image_for_codebook = torch.rand(2, 3, 112, 112)
         image_patches_mask = torch.randint(0, 2, (2, 196), dtype=torch.long)
-        text_masked = text.detach().clone()
+        text_masked = text.clone()
         text_masked[:, 1:3] = 100
-        mlm_labels = text.detach().clone()
-        mlm_labels[:, :] = -1
+        mlm_labels = torch.full_like(text, -1)
         mlm_labels[:, 1:3] = text[:, 1:3]
         itm_labels = torch.tensor((0, 1), dtype=torch.long)
-        flava = flava_model_for_pretraining()
-        flava.eval()
-        output = flava(
+        return dict(
             image=image,
             text=text,
             image_for_codebook=image_for_codebook,
             image_patches_mask=image_patches_mask,
             text_masked=text_masked,
-            required_embedding="mm",
             itm_labels=itm_labels,
             mlm_labels=mlm_labels,
         )
-        self.assertIsNone(output.mlm_output)
-        self.assertIsNone(output.mim_output)
-        self.assertIsNotNone(output.global_contrastive_output)
-        self.assertIsNotNone(output.mmm_text_output)
-        self.assertIsNotNone(output.mmm_image_output)
-        self.assertIsNotNone(output.itm_output)
-        self.assertAlmostEqual(
-            sum(
-                value if value is not None else 0 for value in output.losses.values()
-            ).item(),
-            21.5150,
-            places=4,
-        )
 
-        output = flava(
-            image=image,
-            text=text,
-            image_for_codebook=image_for_codebook,
-            image_patches_mask=image_patches_mask,
-            text_masked=text_masked,
-            required_embedding="image",
-            itm_labels=itm_labels,
-            mlm_labels=mlm_labels,
-        )
-        self.assertIsNone(output.mlm_output)
-        self.assertIsNotNone(output.mim_output)
-        self.assertIsNone(output.global_contrastive_output)
-        self.assertIsNone(output.mmm_text_output)
-        self.assertIsNone(output.mmm_image_output)
-        self.assertIsNone(output.itm_output)
-        self.assertAlmostEqual(
-            sum(
-                value if value is not None else 0 for value in output.losses.values()
-            ).item(),
-            8.9674,
-            places=4,
-        )
+    @pytest.fixture(scope="class")
+    def flava_pretraining(self, pretraining_inputs):
+        # Depends on pretraining_inputs so the model is initialized right after
+        # the inputs, from the same RNG stream
+        flava = flava_model_for_pretraining()
+        flava.eval()
+        return flava
 
-        output = flava(
-            image=image,
-            text=text,
-            image_for_codebook=image_for_codebook,
-            image_patches_mask=image_patches_mask,
-            text_masked=text_masked,
-            required_embedding="text",
-            itm_labels=itm_labels,
-            mlm_labels=mlm_labels,
-        )
-        self.assertIsNotNone(output.mlm_output)
-        self.assertIsNone(output.mim_output)
-        self.assertIsNone(output.global_contrastive_output)
-        self.assertIsNone(output.mmm_text_output)
-        self.assertIsNone(output.mmm_image_output)
-        self.assertIsNone(output.itm_output)
+    @torch.inference_mode()
+    def test_forward_classification(self, classification_inputs, flava_cls):
+        image, text, labels = classification_inputs
+        for required_embedding, expected in [
+            ("mm", 0.7180),
+            ("image", 0.7020),
+            ("text", 0.6663),
+        ]:
+            output = flava_cls(image, text, required_embedding, labels)
+            assert_expected(output.loss.item(), expected, rtol=0, atol=5e-5)
 
-        self.assertAlmostEqual(
-            sum(
-                value if value is not None else 0 for value in output.losses.values()
-            ).item(),
-            10.0305,
-            places=4,
-        )
+    @pytest.mark.parametrize(
+        "required_embedding, expected_outputs, expected_loss",
+        [
+            (
+                "mm",
+                {
+                    "global_contrastive_output",
+                    "mmm_text_output",
+                    "mmm_image_output",
+                    "itm_output",
+                },
+                21.5150,
+            ),
+            ("image", {"mim_output"}, 8.9674),
+            ("text", {"mlm_output"}, 10.0305),
+        ],
+    )
+    @torch.inference_mode()
+    def test_forward_pretraining(
+        self,
+        pretraining_inputs,
+        flava_pretraining,
+        required_embedding,
+        expected_outputs,
+        expected_loss,
+    ):
+        inputs = pretraining_inputs
+        if required_embedding == "text":
+            # Codebook labels only feed the image losses, which text mode never computes
+            inputs = dict(inputs, image_for_codebook=None)
+        output = flava_pretraining(**inputs, required_embedding=required_embedding)
+        for name in PRETRAINING_OUTPUTS:
+            if name in expected_outputs:
+                assert getattr(output, name) is not None, name
+            else:
+                assert getattr(output, name) is None, name
+        assert_expected(_total_loss(output), expected_loss, rtol=0, atol=5e-5)
 
 
 class TestFLAVAModel(unittest.TestCase):
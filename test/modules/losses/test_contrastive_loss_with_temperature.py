@@ -6,8 +6,8 @@
 
 import unittest
 from itertools import chain
-from typing import List
 
+import pytest
 import torch
 import torch.multiprocessing as mp
 import torch.nn as nn
@@ -20,6 +20,32 @@ from torchmultimodal.modules.losses.contrastive_loss_with_temperature import (
 from torchmultimodal.utils.common import get_current_device
 
 
+@pytest.fixture(scope="class")
+def contrastive_losses(request):
+    # Loss modules and embeddings are read-only across the CPU tests, so build them
+    # once per class instead of once per test
+    cls = request.cls
+    device = get_current_device()
+    # Use a local generator so building the inputs doesn't touch the global RNG
+    generator = torch.Generator().manual_seed(1234)
+    cls.image_embeddings = torch.randn(3, 5, generator=generator)
+    cls.text_embeddings = torch.randn(3, 5, generator=generator)
+    cls.default_loss = ContrastiveLossWithTemperature().to(device)
+    cls.loss_at_max = ContrastiveLossWithTemperature(
+        logit_scale=2, logit_scale_max=2
+    ).to(device)
+    cls.loss_above_max = ContrastiveLossWithTemperature(
+        logit_scale=3, logit_scale_max=2
+    ).to(device)
+    cls.loss_at_min = ContrastiveLossWithTemperature(
+        logit_scale=2, logit_scale_min=2
+    ).to(device)
+    cls.loss_below_min = ContrastiveLossWithTemperature(
+        logit_scale=1, logit_scale_min=2
+    ).to(device)
+
+
+@pytest.mark.usefixtures("contrastive_losses")
 class TestContrastiveLossWithTemperature(unittest.TestCase):
     """
     Test the contrastive loss with temperature param
@@ -40,56 +66,41 @@ class TestContrastiveLossWithTemperature(unittest.TestCase):
         self.image_encoder = nn.Linear(self.image_dim, self.embedding_dim)
         self.text_encoder = nn.Linear(self.text_dim, self.embedding_dim)
 
+    @torch.inference_mode()
     def test_local_loss(self):
-        torch.manual_seed(1234)
-        clip_loss = ContrastiveLossWithTemperature()
-        clip_loss = clip_loss.to(get_current_device())
-        image_embeddings = torch.randn(3, 5)
-        text_embeddings = torch.randn(3, 5)
-        loss = clip_loss(
-            image_embeddings=image_embeddings, text_embeddings=text_embeddings
+        loss = self.default_loss(
+            image_embeddings=self.image_embeddings,
+            text_embeddings=self.text_embeddings,
         )
 
         self.assertEqual(loss.size(), torch.Size([]))
         self.assertAlmostEqual(loss.item(), 9.8753, 3)
 
+    @torch.inference_mode()
     def test_temperature_clamp_max(self):
-        torch.manual_seed(1234)
-        clip_loss_at_max = ContrastiveLossWithTemperature(
-            logit_scale=2, logit_scale_max=2
-        ).to(get_current_device())
-        clip_loss_above_max = ContrastiveLossWithTemperature(
-            logit_scale=3, logit_scale_max=2
-        ).to(get_current_device())
-        image_embeddings = torch.randn(3, 5)
-        text_embeddings = torch.randn(3, 5)
-        loss_at_max = clip_loss_at_max(image_embeddings, text_embeddings).item()
-        loss_above_max = clip_loss_above_max(image_embeddings, text_embeddings).item()
+        loss_at_max = self.loss_at_max(
+            self.image_embeddings, self.text_embeddings
+        ).item()
+        loss_above_max = self.loss_above_max(
+            self.image_embeddings, self.text_embeddings
+        ).item()
         self.assertAlmostEqual(first=loss_above_max, second=loss_at_max, places=3)
 
+    @torch.inference_mode()
     def test_temperature_clamp_min(self):
-        torch.manual_seed(1234)
-        clip_loss_at_min = ContrastiveLossWithTemperature(
-            logit_scale=2, logit_scale_min=2
-        ).to(get_current_device())
-        clip_loss_below_min = ContrastiveLossWithTemperature(
-            logit_scale=1, logit_scale_min=2
-        ).to(get_current_device())
-        image_embeddings = torch.randn(3, 5)
-        text_embeddings = torch.randn(3, 5)
-        loss_at_min = clip_loss_at_min(image_embeddings, text_embeddings).item()
-        loss_below_min = clip_loss_below_min(image_embeddings, text_embeddings).item()
+        loss_at_min = self.loss_at_min(
+            self.image_embeddings, self.text_embeddings
+        ).item()
+        loss_below_min = self.loss_below_min(
+            self.image_embeddings, self.text_embeddings
+        ).item()
         self.assertAlmostEqual(first=loss_below_min, second=loss_at_min, places=3)
 
+    @torch.inference_mode()
     def test_loss_with_ce_kwargs(self):
-        torch.manual_seed(1234)
-        clip_loss = ContrastiveLossWithTemperature()
-        clip_loss = clip_loss.to(get_current_device())
-        image_embeddings = torch.randn(3, 5)
-        text_embeddings = torch.randn(3, 5)
-        loss = clip_loss(
-            image_embeddings=image_embeddings,
-            text_embeddings=text_embeddings,
+        loss = self.default_loss(
+            image_embeddings=self.image_embeddings,
+            text_embeddings=self.text_embeddings,
             cross_entropy_kwargs={"label_smoothing": 0.1},
         )
 
@@ -114,10 +125,10 @@ class TestContrastiveLossWithTemperature(unittest.TestCase):
         local_batch_size = self.global_batch_size // world_size
 
         # Split images and text across GPUs
-        local_images = torch.split(self.all_images, local_batch_size)[gpu_id].cuda(
-            gpu_id
-        )
-        local_texts = torch.split(self.all_texts, local_batch_size)[gpu_id].cuda(gpu_id)
+        start = gpu_id * local_batch_size
+        end = start + local_batch_size
+        local_images = self.all_images[start:end].cuda(gpu_id)
+        local_texts = self.all_texts[start:end].cuda(gpu_id)
 
         image_encoder = self.image_encoder.cuda(gpu_id)
         text_encoder = self.text_encoder.cuda(gpu_id)
@@ -142,14 +153,15 @@ class TestContrastiveLossWithTemperature(unittest.TestCase):
         loss.backward()
 
         # Gather gradients from all devices
-        def gather_grads(x: torch.Tensor) -> List[torch.Tensor]:
-            grads = [torch.zeros_like(x).cuda(gpu_id) for i in range(world_size)]
-            dist.all_gather(grads, x)
-            grad = torch.stack(grads).mean()
-            return grad
+        def gather_grads(x: torch.Tensor) -> torch.Tensor:
+            # Average across ranks with a single all_reduce instead of all_gather
+            x = x.clone()
+            dist.all_reduce(x, op=dist.ReduceOp.SUM)
+            x.div_(world_size)
+            return x
 
         # Gather losses from all devices
-        gathered_loss = gather_grads(torch.Tensor([loss]).cuda(gpu_id))
+        gathered_loss = gather_grads(loss.detach().reshape(1))
         self.assertAlmostEqual(gathered_loss.item(), 3.8848, 3)
 
         # Gradients for image encoder weights
@@ -164,6 +176,7 @@ class TestContrastiveLossWithTemperature(unittest.TestCase):
         logit_scale_grad = gather_grads(loss_fn.logit_scale.grad)
         self.assertAlmostEqual(logit_scale_grad.mean().item(), 3.6781, 2)
 
+    @pytest.mark.serial
     @gpu_test(gpu_count=1)
     def test_single_gpu_loss(self):
         with with_temp_files(count=1) as sync_file:
@@ -174,6 +187,7 @@ class TestContrastiveLossWithTemperature(unittest.TestCase):
                 nprocs=world_size,
             )
 
+    @pytest.mark.serial
     @gpu_test(gpu_count=2)
     def test_multi_gpu_loss(self):
         with with_temp_files(count=1) as sync_file: